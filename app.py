@@ -1,9 +1,12 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
-import json
 import os
 import openai
+import asyncio
+import contextlib
+import threading
 import time
 import math
 import database as db
@@ -21,62 +24,225 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- AI HELPER ---
-def get_ai_explanation(question, options, answer):
+# One AsyncOpenAI client and one background event loop are shared by every
+# session, so repeat calls reuse the client's connection pool.
+@st.cache_resource
+def get_ai_client():
     api_key = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
     if not api_key:
-        return "⚠️ OpenAI API Key not found."
-    
-    client = openai.OpenAI(api_key=api_key)
+        return None
+    return openai.AsyncOpenAI(api_key=api_key)
+
+@st.cache_resource
+def get_ai_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def run_ai(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_ai_loop()).result()
+
+AI_MODEL = "gpt-3.5-turbo"
+
+async def explain_async(client, question, options, answer, model=AI_MODEL, sem=None):
     prompt = f"Question: {question}\nOptions: {options}\nCorrect Answer: {answer}\nExplain why the answer is correct and others are wrong."
-    
+
+    async with sem or contextlib.nullcontext():
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    return response.choices[0].message.content
+
+async def explain_many_async(client, questions, model=AI_MODEL, limit=10):
+    sem = asyncio.Semaphore(limit)  # Stay under the API rate limit
+    return await asyncio.gather(*[
+        explain_async(client, q['question_text'], q['options'], q['correct_answer'], model, sem)
+        for q in questions
+    ], return_exceptions=True)
+
+# Explanations are stored per (question, model) so the LLM is only asked once
+def get_ai_explanation(q_id, question, options, answer, model=AI_MODEL):
+    cached = db.get_saved_explanation(q_id, model)
+    if cached:
+        return cached
+
+    client = get_ai_client()
+    if client is None:
+        return "⚠️ OpenAI API Key not found."
+
     try:
         with st.spinner("🤖 AI Guru is thinking..."):
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}]
-            )
-        return response.choices[0].message.content
+            text = run_ai(explain_async(client, question, options, answer, model))
     except Exception as e:
         return f"Error: {str(e)}"
+    db.save_explanation(q_id, model, text)
+    return text
+
+def get_ai_explanations(questions, model=AI_MODEL):
+    """Explain several questions concurrently, returns {q_id: text}"""
+    results = {}
+    missing = []
+    for q in questions:
+        cached = db.get_saved_explanation(q['id'], model)
+        if cached: results[q['id']] = cached
+        else: missing.append(q)
+    if not missing:
+        return results
+
+    client = get_ai_client()
+    if client is None:
+        results.update({q['id']: "⚠️ OpenAI API Key not found." for q in missing})
+        return results
+
+    with st.spinner(f"🤖 AI Guru is explaining {len(missing)} questions..."):
+        texts = run_ai(explain_many_async(client, missing, model))
+    for q, t in zip(missing, texts):
+        if isinstance(t, Exception):
+            results[q['id']] = f"Error: {str(t)}"
+        else:
+            db.save_explanation(q['id'], model, t)
+            results[q['id']] = t
+    return results
+
+# --- CACHED DB READS ---
+# Every click reruns the whole script, so reads are served from st.cache_data
+# and dropped explicitly whenever the questions table is written to.
+@st.cache_data(ttl=300)
+def cached_topics():
+    return db.get_all_topics()
+
+@st.cache_data(ttl=300)
+def cached_question_stats():
+    return db.get_question_stats(), db.get_overall_stats()
+
+@st.cache_data(ttl=300)
+def cached_study_questions(topic="All"):
+    return db.get_study_questions(topic)
+
+@st.cache_data(ttl=300)
+def cached_questions_page(limit, offset, topic, show_unknown):
+    return db.get_questions_page(limit=limit, offset=offset, topic=topic, show_unknown=show_unknown)
+
+# Counted once per filter, so flipping pages only runs the page query
+@st.cache_data(ttl=60)
+def cached_question_count(topic, show_unknown):
+    return db.count_questions(topic=topic, show_unknown=show_unknown)
+
+@st.cache_data(ttl=300)
+def cached_parsing_errors():
+    return db.get_parsing_errors()
+
+def clear_question_cache():
+    cached_topics.clear()
+    cached_question_stats.clear()
+    cached_study_questions.clear()
+    cached_questions_page.clear()
+    cached_question_count.clear()
+
+# --- CACHED IMAGES ---
+# Keyed on mtime so an image replaced on disk is picked up again; bounded so
+# the bytes of every image ever shown don't stay in memory for the server's lifetime
+@st.cache_data(max_entries=200)
+def load_image(path, mtime):
+    with open(path, "rb") as f:
+        return f.read()
+
+def question_image(q):
+    """Image bytes for a question, or None if it has none or the file has gone"""
+    if not q['has_image']:
+        return None
+    try:
+        # Exam questions sit in session state for hours; the file may be removed meanwhile
+        return load_image(q['image_path'], os.path.getmtime(q['image_path']))
+    except OSError:
+        return None
+
+# --- CACHED CHARTS ---
+# Figures are keyed on plain tuples of the plotted values, so reruns with
+# unchanged data reuse the built figure instead of constructing a new one.
+@st.cache_data
+def build_radar_chart(topic_percents):
+    topics = [t for t, _ in topic_percents]
+    percents = np.asarray([p for _, p in topic_percents])
+    fig = go.Figure(data=go.Scatterpolar(
+        r=percents, theta=topics, fill='toself', name='Mastery %'
+    ))
+    fig.update_layout(polar=dict(radialaxis=dict(visible=True, range=[0, 100])), title="Topic Proficiency")
+    return fig
+
+@st.cache_data
+def build_topic_bar_chart(topic_counts):
+    topic_names = [f"{t} ({c}/{n})" for t, c, n in topic_counts]
+    topic_pcts = np.asarray([(c / n) * 100 if n > 0 else 0 for _, c, n in topic_counts])
+    fig = go.Figure(go.Bar(
+        x=topic_pcts,
+        y=topic_names,
+        orientation='h',
+        marker=dict(color=topic_pcts, colorscale='RdYlGn', cmin=0, cmax=100)
+    ))
+    fig.update_layout(xaxis_title="Accuracy %", yaxis={'categoryorder':'total ascending'})
+    return fig
 
 # --- UI MODES ---
 
 def render_dashboard():
     st.title("📊 Mastery Dashboard")
-    stats = db.get_question_stats()
+    stats, totals = cached_question_stats()
     
     if stats.empty:
         st.info("No data. Start studying!")
         return
-
-    stats['percent'] = (stats['mastered_count'] / stats['total_questions']) * 100
     
     # Radar Chart
-    fig = go.Figure(data=go.Scatterpolar(
-        r=stats['percent'], theta=stats['topic'], fill='toself', name='Mastery %'
-    ))
-    fig.update_layout(polar=dict(radialaxis=dict(visible=True, range=[0, 100])), title="Topic Proficiency")
+    fig = build_radar_chart(tuple(zip(stats['topic'], stats['percent'])))
     
     c1, c2 = st.columns([2, 1])
     with c1: st.plotly_chart(fig, use_container_width=True)
     with c2:
-        st.metric("Questions Mastered", f"{stats['mastered_count'].sum()}/{stats['total_questions'].sum()}")
+        st.metric("Questions Mastered", f"{totals['mastered_count']}/{totals['total_questions']}")
         st.caption("Deep Mastery: Streak > 3")
-        st.progress(stats['mastered_count'].sum() / stats['total_questions'].sum())
+        st.progress(totals['mastered_count'] / totals['total_questions'])
+
+# --- BUTTON CALLBACKS ---
+# State changes happen in on_click callbacks; Streamlit reruns exactly once
+# afterwards, instead of once for the click and again for st.rerun().
+def toggle_study_flag(q_id, flagged):
+    db.toggle_flag(q_id, flagged)
+    clear_question_cache()
+
+def go_to_question(i):
+    st.session_state.exam_current_idx = i
+
+def submit_exam():
+    st.session_state.exam_submitted = True
+
+def exit_exam():
+    del st.session_state['exam_active']
+    del st.session_state['exam_submitted']
+    st.session_state.pop('exam_ai_explanations', None)
+    st.session_state.pop('exam_results_df', None)
+
+def toggle_exam_flag(q_idx):
+    st.session_state.exam_flagged[q_idx] = not st.session_state.exam_flagged[q_idx]
+
+def grade_due_card(q, is_correct):
+    quality = 5 if is_correct else 0
+    db.update_history(q['id'], is_correct, sr.calculate_next_review(quality, q['streak'], q['ease_factor'], q['interval_days']))
+    cached_question_stats.clear()
 
 def render_study_mode():
     st.header("📖 Interactive Study Mode")
     
     # Sidebar
-    topic = st.sidebar.selectbox("Filter Topic", ["All"] + db.get_all_topics())
+    topic = st.sidebar.selectbox("Filter Topic", ["All"] + cached_topics())
     
     # Session State Init
-    if 'study_q_list' not in st.session_state or st.session_state.get('last_topic') != topic:
-        st.session_state.study_q_list = db.get_study_questions(topic)
+    if 'study_index' not in st.session_state or st.session_state.get('last_topic') != topic:
         st.session_state.study_index = 0
         st.session_state.last_topic = topic
 
-    questions = st.session_state.study_q_list
+    questions = cached_study_questions(topic)
     if not questions:
         st.warning("No questions found.")
         return
@@ -95,20 +261,17 @@ def render_study_mode():
     with c2:
         # Flagging Feature
         flag_icon = "🚩" if q['flagged'] else "🏳️"
-        if st.button(f"{flag_icon} Flag", key=f"flag_{q['id']}"):
-            new_status = db.toggle_flag(q['id'], q['flagged'])
-            q['flagged'] = new_status
-            st.rerun()
+        st.button(f"{flag_icon} Flag", key=f"flag_{q['id']}", on_click=toggle_study_flag, args=(q['id'], q['flagged']))
 
     # Image Handling with Zoom
-    if q['image_path'] and os.path.exists(q['image_path']):
-        st.image(q['image_path'], width=400)
+    img = question_image(q)
+    if img:
+        st.image(img, width=400)
         with st.expander("🔍 Zoom Image"):
-            st.image(q['image_path'], use_container_width=True)
+            st.image(img, use_container_width=True)
 
     # Options
-    try: options = json.loads(q['options'])
-    except: options = []
+    options = q['options_list']
     
     with st.form(key=f"study_form_{q['id']}"):
         choice = st.radio("Select Answer:", options, index=None)
@@ -133,16 +296,12 @@ def render_study_mode():
             
             # AI Help
             if st.button("🤖 Ask AI Guru"):
-                st.write(get_ai_explanation(q['question_text'], q['options'], q['correct_answer']))
+                st.write(get_ai_explanation(q['id'], q['question_text'], q['options'], q['correct_answer']))
 
     # Navigation
     c1, c2 = st.columns(2)
-    if c1.button("⬅️ Previous"):
-        st.session_state.study_index = max(0, idx - 1)
-        st.rerun()
-    if c2.button("Next ➡️"):
-        st.session_state.study_index = min(len(questions)-1, idx + 1)
-        st.rerun()
+    c1.button("⬅️ Previous", on_click=lambda: st.session_state.update(study_index=max(0, idx - 1)))
+    c2.button("Next ➡️", on_click=lambda: st.session_state.update(study_index=min(len(questions)-1, idx + 1)))
 
 def render_exam_mode():
     st.header("⏱️ Mock Exam Simulator")
@@ -164,12 +323,16 @@ def render_exam_mode():
 
             # Initialize Session State
             st.session_state.exam_questions = questions
-            st.session_state.exam_answers = {}      # {q_id: "A"}
-            st.session_state.exam_flags = set()     # {q_id, q_id...}
+            # Per-question state as parallel arrays, indexed by exam position
+            n = len(questions)
+            st.session_state.exam_answered = np.zeros(n, dtype=bool)
+            st.session_state.exam_flagged = np.zeros(n, dtype=bool)
+            st.session_state.exam_choice_idx = np.full(n, -1, dtype=np.int8)  # -1 = unanswered
             st.session_state.exam_active = True
             st.session_state.exam_submitted = False
             st.session_state.exam_start_time = time.time()
             st.session_state.exam_current_idx = 0   # Track current question
+            st.session_state.pop('exam_results_df', None)
             st.rerun()
         return
 
@@ -190,57 +353,18 @@ def render_exam_mode():
         st.title("Exam Controls")
         
         if not st.session_state.exam_submitted:
-            mins, secs = divmod(remaining, 60)
-            # Color changes based on urgency
-            timer_color = "red" if mins < 10 else "green"
-            st.markdown(f"<h2 style='text-align: center; color: {timer_color};'>{mins:02d}:{secs:02d}</h2>", unsafe_allow_html=True)
-            st.progress(1 - (elapsed / limit_sec))
+            render_exam_timer(st.session_state.exam_start_time, limit_sec)
         
         st.markdown("---")
         st.subheader("Question Navigator")
         
-        # Grid Layout for 100 Buttons
-        # We use a 5-column grid for the buttons
-        cols = st.columns(5)
-        for i in range(len(questions)):
-            q = questions[i]
-            qid = q['id']
-            
-            # Determine Button Style
-            label = f"{i + 1}"
-            
-            # Visual Indicators
-            is_answered = qid in st.session_state.exam_answers
-            is_flagged = qid in st.session_state.exam_flags
-            is_current = (i == st.session_state.exam_current_idx)
-            
-            # Streamlit doesn't support direct button coloring easily, 
-            # so we use emojis or simple logic.
-            if is_current:
-                btn_type = "primary"
-            else:
-                btn_type = "secondary"
-                
-            # Add markers to label
-            if is_flagged: label += " 🚩"
-            elif is_answered: label += " ✅"
-            
-            # The Navigation Button
-            with cols[i % 5]:
-                if st.button(label, key=f"nav_{i}", type=btn_type, use_container_width=True):
-                    st.session_state.exam_current_idx = i
-                    st.rerun()
+        render_nav_grid(questions)
 
         st.markdown("---")
         if not st.session_state.exam_submitted:
-            if st.button("📥 Submit Exam", type="primary", use_container_width=True):
-                st.session_state.exam_submitted = True
-                st.rerun()
+            st.button("📥 Submit Exam", type="primary", use_container_width=True, on_click=submit_exam)
         else:
-            if st.button("❌ Exit Exam Mode", type="secondary", use_container_width=True):
-                del st.session_state['exam_active']
-                del st.session_state['exam_submitted']
-                st.rerun()
+            st.button("❌ Exit Exam Mode", type="secondary", use_container_width=True, on_click=exit_exam)
 
     # --- 4. EXAM LOGIC: VIEW vs RESULT ---
     
@@ -250,6 +374,55 @@ def render_exam_mode():
         return
 
     # B. QUESTION VIEW (If Active)
+    render_exam_question(questions)
+
+# --- HELPER: EXAM TIMER ---
+# Ticks on its own every second, so the clock keeps running (and time-up
+# still submits) while the user is idle, without rerunning the whole page.
+@st.fragment(run_every=1)
+def render_exam_timer(start_time, limit_sec):
+    elapsed = int(time.time() - start_time)
+    remaining = limit_sec - elapsed
+    
+    if remaining <= 0:
+        st.session_state.exam_submitted = True
+        st.rerun()
+    
+    mins, secs = divmod(remaining, 60)
+    # Color changes based on urgency
+    timer_color = "red" if mins < 10 else "green"
+    st.markdown(f"<h2 style='text-align: center; color: {timer_color};'>{mins:02d}:{secs:02d}</h2>", unsafe_allow_html=True)
+    st.progress(1 - (elapsed / limit_sec))
+
+# --- HELPER: EXAM NAVIGATOR ---
+def render_nav_grid(questions):
+    # Grid Layout for 100 Buttons
+    # We use a 5-column grid for the buttons
+    cols = st.columns(5)
+    
+    # Visual Indicators: flag wins over answered
+    markers = np.where(st.session_state.exam_flagged, " 🚩",
+                       np.where(st.session_state.exam_answered, " ✅", ""))
+    labels = [f"{i + 1}{m}" for i, m in enumerate(markers)]
+    
+    for i, label in enumerate(labels):
+        # Streamlit doesn't support direct button coloring easily, 
+        # so we use emojis or simple logic.
+        btn_type = "primary" if i == st.session_state.exam_current_idx else "secondary"
+        
+        # The Navigation Button
+        with cols[i % 5]:
+            st.button(label, key=f"nav_{i}", type=btn_type, use_container_width=True, on_click=go_to_question, args=(i,))
+
+# Stores the pick from the radio's own callback, before the fragment reruns
+def save_exam_answer(q_idx, qid, ops):
+    st.session_state.exam_choice_idx[q_idx] = ops.index(st.session_state[f"radio_{qid}"])
+    st.session_state.exam_answered[q_idx] = True
+
+# Runs as a fragment so answer picks and flag toggles only redraw the question
+# pane instead of re-emitting the 100-button navigator in the sidebar.
+@st.fragment
+def render_exam_question(questions):
     q_idx = st.session_state.exam_current_idx
     q = questions[q_idx]
     
@@ -259,51 +432,43 @@ def render_exam_mode():
         st.subheader(f"Question {q_idx + 1} of {len(questions)}")
     with c2:
         # Flag Toggle
-        flagged = q['id'] in st.session_state.exam_flags
+        flagged = st.session_state.exam_flagged[q_idx]
         btn_text = "🚩 Unflag" if flagged else "🏳️ Flag"
-        if st.button(btn_text, key=f"flag_btn_{q['id']}"):
-            if flagged:
-                st.session_state.exam_flags.remove(q['id'])
-            else:
-                st.session_state.exam_flags.add(q['id'])
-            st.rerun()
+        st.button(btn_text, key=f"flag_btn_{q['id']}", on_click=toggle_exam_flag, args=(q_idx,))
 
     # --- Display Content ---
     st.markdown(f"**{q['question_text']}**")
     
-    if q['image_path'] and os.path.exists(q['image_path']):
-        st.image(q['image_path'])
+    img = question_image(q)
+    if img:
+        st.image(img)
 
     # --- Display Options ---
-    try: 
-        ops = json.loads(q['options'])
-    except: 
-        ops = []
-        
-    current_answer = st.session_state.exam_answers.get(q['id'])
+    ops = q['options_list']
     
     # Option Selection
     if ops:
         # Determine index of previous selection to keep radio state
-        idx = ops.index(current_answer) if current_answer in ops else None
+        choice = int(st.session_state.exam_choice_idx[q_idx])
+        idx = choice if choice >= 0 else None
         
-        sel = st.radio(
+        st.radio(
             "Select Answer:", 
             ops, 
             index=idx, 
             key=f"radio_{q['id']}", 
-            label_visibility="collapsed"
+            label_visibility="collapsed",
+            on_change=save_exam_answer,
+            args=(q_idx, q['id'], ops)
         )
-        
-        # Save selection immediately
-        if sel:
-            st.session_state.exam_answers[q['id']] = sel
     else:
         st.info("Refer to the image or text for options (Drag & Drop / Sim).")
 
     st.markdown("---")
     
     # --- Navigation Footer ---
+    # Kept as a full rerun: a callback here would only rerun this fragment
+    # and leave the navigator highlighting the previous question.
     c1, c2, c3 = st.columns([1, 4, 1])
     with c1:
         if st.button("⬅️ Back", disabled=(q_idx == 0)):
@@ -315,30 +480,30 @@ def render_exam_mode():
             st.rerun()
 
 # --- HELPER: RESULT ANALYTICS ---
+def grade_exam(questions):
+    """Grade the whole exam in one vectorized pass, one row per question"""
+    choice_idx = st.session_state.exam_choice_idx
+    df = pd.DataFrame({
+        'id': [q['id'] for q in questions],
+        'topic': [q['topic'] for q in questions],
+        'user': [q['options_list'][c] if c >= 0 else "Unanswered" for q, c in zip(questions, choice_idx)],
+        'corr': [q['correct_answer'] for q in questions],
+        'flagged': st.session_state.exam_flagged,
+    })
+    df['user_let'] = df['user'].str.split('.').str[0]
+    df['corr_let'] = df['corr'].str.split(',').str[0].str.split('.').str[0].str.strip()
+    df['correct'] = df['user_let'] == df['corr_let']
+    return df
+
 def render_exam_results(questions):
     st.success("🏁 Exam Submitted!")
     
-    # 1. Calculate Score
-    score = 0
-    topic_scores = {} # { "Routing": {'correct': 2, 'total': 5} }
+    # 1. Calculate Score (graded once, reused on every rerun of this page)
+    if 'exam_results_df' not in st.session_state:
+        st.session_state.exam_results_df = grade_exam(questions)
+    results = st.session_state.exam_results_df
     
-    for q in questions:
-        # Get Data
-        user_ans_full = st.session_state.exam_answers.get(q['id'], "")
-        user_let = user_ans_full.split(".")[0] if user_ans_full else "Unanswered"
-        corr_let = q['correct_answer'].split(",")[0]
-        topic = q['topic']
-        
-        # Init Topic Stats
-        if topic not in topic_scores: topic_scores[topic] = {'correct': 0, 'total': 0}
-        topic_scores[topic]['total'] += 1
-        
-        # Grade (Simple Match)
-        is_correct = (user_let == corr_let)
-        if is_correct:
-            score += 1
-            topic_scores[topic]['correct'] += 1
-            
+    score = int(results['correct'].sum())
     total_q = len(questions)
     percentage = int((score / total_q) * 100)
     
@@ -357,21 +522,8 @@ def render_exam_results(questions):
     # 3. Topic Breakdown (Bar Chart)
     st.subheader("📊 Performance by Topic")
     
-    topic_names = []
-    topic_pcts = []
-    
-    for t, data in topic_scores.items():
-        pct = (data['correct'] / data['total']) * 100 if data['total'] > 0 else 0
-        topic_names.append(f"{t} ({data['correct']}/{data['total']})")
-        topic_pcts.append(pct)
-        
-    fig = go.Figure(go.Bar(
-        x=topic_pcts,
-        y=topic_names,
-        orientation='h',
-        marker=dict(color=topic_pcts, colorscale='RdYlGn', cmin=0, cmax=100)
-    ))
-    fig.update_layout(xaxis_title="Accuracy %", yaxis={'categoryorder':'total ascending'})
+    topic_scores = results.groupby('topic', sort=False)['correct'].agg(['sum', 'count'])
+    fig = build_topic_bar_chart(tuple(zip(topic_scores.index, topic_scores['sum'].tolist(), topic_scores['count'].tolist())))
     st.plotly_chart(fig, use_container_width=True)
     
     # 4. Detailed Review
@@ -381,24 +533,34 @@ def render_exam_results(questions):
     # Filter Controls
     filter_mode = st.radio("Show:", ["All", "Incorrect Only", "Flagged Only"], horizontal=True)
     
-    for i, q in enumerate(questions):
-        user_ans = st.session_state.exam_answers.get(q['id'], "Unanswered")
-        user_let = user_ans.split(".")[0]
-        corr_let = q['correct_answer'].split(",")[0]
-        is_correct = (user_let == corr_let)
-        is_flagged = q['id'] in st.session_state.exam_flags
-        
-        # Filtering Logic
-        if filter_mode == "Incorrect Only" and is_correct: continue
-        if filter_mode == "Flagged Only" and not is_flagged: continue
+    # Bulk AI review: fan out one request per incorrect answer
+    if 'exam_ai_explanations' not in st.session_state:
+        st.session_state.exam_ai_explanations = {}
+    if st.button("🤖 Explain All Incorrect"):
+        incorrect = [q for q, ok in zip(questions, results['correct']) if not ok]
+        st.session_state.exam_ai_explanations.update(get_ai_explanations(incorrect))
+    
+    # Filtering Logic
+    if filter_mode == "Incorrect Only":
+        shown = results.index[~results['correct']]
+    elif filter_mode == "Flagged Only":
+        shown = results.index[results['flagged']]
+    else:
+        shown = results.index
+    
+    for i in shown:
+        q = questions[i]
+        row = results.loc[i]
+        user_ans, user_let, corr_let, is_correct = row['user'], row['user_let'], row['corr_let'], row['correct']
         
         # Render Review Card
         color = "green" if is_correct else "red"
         with st.expander(f"Q{i+1}: {q['topic']} - {user_let} vs {corr_let} ({'✅' if is_correct else '❌'})"):
             st.markdown(f"**Question:** {q['question_text']}")
             
-            if q['image_path'] and os.path.exists(q['image_path']):
-                st.image(q['image_path'], width=300)
+            img = question_image(q)
+            if img:
+                st.image(img, width=300)
             
             c1, c2 = st.columns(2)
             c1.markdown(f"**Your Answer:** :{color}[{user_ans}]")
@@ -406,13 +568,16 @@ def render_exam_results(questions):
             
             if q['explanation']:
                 st.info(f"**Explanation:** {q['explanation']}")
+            
+            if q['id'] in st.session_state.exam_ai_explanations:
+                st.markdown(f"**🤖 AI Guru:** {st.session_state.exam_ai_explanations[q['id']]}")
 
 def render_bulk_editor():
     st.header("🛠️ Bulk Editor (Paginated)")
     
     # Filters
     c1, c2, c3 = st.columns(3)
-    topic = c1.selectbox("Topic", ["All"] + db.get_all_topics())
+    topic = c1.selectbox("Topic", ["All"] + cached_topics())
     show_unk = c2.checkbox("Show Unknown Only")
     page_size = 50
     
@@ -420,12 +585,13 @@ def render_bulk_editor():
     if 'editor_page' not in st.session_state: st.session_state.editor_page = 0
     
     # Fetch Data
-    df, total_rows = db.get_questions_paginated(
+    df = cached_questions_page(
         limit=page_size, 
         offset=st.session_state.editor_page * page_size,
         topic=topic,
         show_unknown=show_unk
     )
+    total_rows = cached_question_count(topic, show_unk)
     
     # Pagination Controls
     total_pages = (total_rows // page_size) + 1
@@ -447,16 +613,13 @@ def render_bulk_editor():
     )
     
     if st.button("💾 Save Changes"):
-        updates = []
-        for i, row in edited.iterrows():
-            updates.append(row.to_dict())
+        updates = edited.to_dict(orient="records")
         
         if db.update_bulk_questions(updates):
             st.success("Saved!")
             
             # --- CLEAR CACHE SO STUDY MODE REFRESHES ---
-            if 'study_q_list' in st.session_state:          # NEW LINE
-                del st.session_state['study_q_list']        # NEW LINE
+            clear_question_cache()
             # -------------------------------------------
 
             time.sleep(1)
@@ -468,7 +631,7 @@ def render_quarantine():
     st.header("☣️ Quarantine Zone")
     st.info("These questions failed parsing. Review text and add manually if needed.")
     
-    df = db.get_parsing_errors()
+    df = cached_parsing_errors()
     if df.empty:
         st.success("No errors found!")
         return
@@ -476,9 +639,13 @@ def render_quarantine():
     st.dataframe(df)
 
 # --- MAIN ---
+@st.cache_resource
+def ensure_db():
+    # Runs once per server process; CREATE IF NOT EXISTS also migrates older DBs
+    db.init_db()
+
 def main():
-    if not os.path.exists(db.DB_PATH):
-        db.init_db()
+    ensure_db()
         
     st.sidebar.title("Networking Genius 🚀")
     
@@ -498,12 +665,8 @@ def main():
             if st.button("Show Answer"):
                 st.write(f"Answer: {q['correct_answer']}")
                 c1, c2 = st.columns(2)
-                if c1.button("Wrong (Reset)"): 
-                    db.update_history(q['id'], False, sr.calculate_next_review(0, q['streak'], q['ease_factor'], q['interval_days']))
-                    st.rerun()
-                if c2.button("Correct"):
-                    db.update_history(q['id'], True, sr.calculate_next_review(5, q['streak'], q['ease_factor'], q['interval_days']))
-                    st.rerun()
+                c1.button("Wrong (Reset)", on_click=grade_due_card, args=(q, False))
+                c2.button("Correct", on_click=grade_due_card, args=(q, True))
         else:
             st.success("All caught up!")
     elif choice == "Bulk Editor": render_bulk_editor()
@@ -2,78 +2,154 @@ import sqlite3
 import pandas as pd
 from datetime import datetime
 import json
+import os
+import random
+import threading
+from contextlib import contextmanager
 
 DB_PATH = "study_app.db"
 
+def question_from_row(row):
+    """Convert a questions row to a dict with its options JSON parsed and image checked"""
+    q = dict(row)
+    try: q['options_list'] = json.loads(q['options'])
+    except: q['options_list'] = []
+    q['has_image'] = bool(q['image_path']) and os.path.exists(q['image_path'])
+    return q
+
 def get_db_connection():
     conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    c.execute("PRAGMA foreign_keys = ON;")
+# --- Shared connection for the app ---
+# Opened once per process and reused by every helper below. It runs in
+# autocommit mode, so every write goes through transaction(), which holds
+# _write_lock: otherwise one session's write could land in another's transaction.
+_conn = None
+_conn_ino = None
+_write_lock = threading.RLock()
+
+def db_file_id():
+    try:
+        return os.stat(DB_PATH).st_ino
+    except FileNotFoundError:
+        return None
+
+def get_conn():
+    global _conn, _conn_ino
+    # setup_db.py deletes and rebuilds the file; reopen so we don't keep reading the old one
+    if _conn is None or db_file_id() != _conn_ino:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        conn.execute("PRAGMA mmap_size = 268435456;")
+        _conn, _conn_ino = conn, db_file_id()
+    return _conn
+
+@contextmanager
+def transaction():
+    conn = get_conn()
+    with _write_lock:
+        conn.execute("BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except:
+            # Never leave the shared connection stuck inside an open transaction
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+# Bump SCHEMA_VERSION whenever SCHEMA changes so existing DBs get migrated
+SCHEMA_VERSION = 1
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        question_number TEXT UNIQUE,
+        question_text TEXT,
+        options TEXT, 
+        image_path TEXT,
+        correct_answer TEXT DEFAULT 'Unknown',
+        topic TEXT DEFAULT 'General',
+        explanation TEXT,
+        question_type TEXT DEFAULT 'standard',
+        flagged BOOLEAN DEFAULT 0
+    );
     
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS questions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question_number TEXT UNIQUE,
-            question_text TEXT,
-            options TEXT, 
-            image_path TEXT,
-            correct_answer TEXT DEFAULT 'Unknown',
-            topic TEXT DEFAULT 'General',
-            explanation TEXT,
-            question_type TEXT DEFAULT 'standard',
-            flagged BOOLEAN DEFAULT 0
-        )
-    ''')
+    CREATE TABLE IF NOT EXISTS history (
+        question_id INTEGER PRIMARY KEY,
+        times_correct INTEGER DEFAULT 0,
+        times_wrong INTEGER DEFAULT 0,
+        last_seen TIMESTAMP,
+        next_review_due TIMESTAMP,
+        streak INTEGER DEFAULT 0,
+        ease_factor REAL DEFAULT 2.5,
+        interval_days INTEGER DEFAULT 0,
+        FOREIGN KEY(question_id) REFERENCES questions(id)
+    );
     
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS history (
-            question_id INTEGER PRIMARY KEY,
-            times_correct INTEGER DEFAULT 0,
-            times_wrong INTEGER DEFAULT 0,
-            last_seen TIMESTAMP,
-            next_review_due TIMESTAMP,
-            streak INTEGER DEFAULT 0,
-            ease_factor REAL DEFAULT 2.5,
-            interval_days INTEGER DEFAULT 0,
-            FOREIGN KEY(question_id) REFERENCES questions(id)
-        )
-    ''')
+    CREATE TABLE IF NOT EXISTS user_notes (
+        question_id INTEGER PRIMARY KEY,
+        note_text TEXT,
+        FOREIGN KEY(question_id) REFERENCES questions(id)
+    );
+
+    -- NEW: Quarantine zone for bad parsing
+    CREATE TABLE IF NOT EXISTS parsing_errors (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        raw_text TEXT,
+        error_reason TEXT,
+        source_page INTEGER
+    );
+
+    -- Cached LLM explanations, one per question and model
+    CREATE TABLE IF NOT EXISTS ai_explanations (
+        question_id INTEGER,
+        model TEXT,
+        text TEXT,
+        created_at TIMESTAMP,
+        PRIMARY KEY(question_id, model),
+        FOREIGN KEY(question_id) REFERENCES questions(id)
+    );
+
+    -- Indexes for the hot paths: due-card lookup, topic grouping, flagged filter
+    CREATE INDEX IF NOT EXISTS idx_history_due ON history(next_review_due);
+    CREATE INDEX IF NOT EXISTS idx_questions_topic ON questions(topic);
+    CREATE INDEX IF NOT EXISTS idx_questions_flagged ON questions(flagged) WHERE flagged = 1;
+'''
+
+def init_db():
+    conn = get_db_connection()
     
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS user_notes (
-            question_id INTEGER PRIMARY KEY,
-            note_text TEXT,
-            FOREIGN KEY(question_id) REFERENCES questions(id)
-        )
-    ''')
-
-    # NEW: Quarantine zone for bad parsing
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS parsing_errors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            raw_text TEXT,
-            error_reason TEXT,
-            source_page INTEGER
-        )
-    ''')
+    # Already on the current schema: nothing to do
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return
     
-    conn.commit()
+    # journal_mode can't change inside a transaction, so set it first
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.executescript(f"""
+        BEGIN;
+        {SCHEMA}
+        ANALYZE;
+        PRAGMA user_version = {SCHEMA_VERSION};
+        COMMIT;
+    """)
     conn.close()
 
 def get_question_stats(topic_filter=None):
-    conn = get_db_connection()
+    conn = get_conn()
     base_query = """
         SELECT 
             q.topic,
             COUNT(q.id) as total_questions,
             SUM(CASE WHEN h.times_correct > 0 THEN 1 ELSE 0 END) as mastered_count,
-            SUM(CASE WHEN h.streak > 3 THEN 1 ELSE 0 END) as deep_mastery
+            SUM(CASE WHEN h.streak > 3 THEN 1 ELSE 0 END) as deep_mastery,
+            100.0 * SUM(CASE WHEN h.times_correct > 0 THEN 1 ELSE 0 END) / COUNT(q.id) as percent
         FROM questions q
         LEFT JOIN history h ON q.id = h.question_id
     """
@@ -84,12 +160,21 @@ def get_question_stats(topic_filter=None):
     else:
         params = ()
     base_query += " GROUP BY q.topic"
-    df = pd.read_sql(base_query, conn, params=params)
-    conn.close()
-    return df
+    return pd.read_sql(base_query, conn, params=params)
+
+def get_overall_stats():
+    """Totals across all topics for the dashboard metrics"""
+    row = get_conn().execute("""
+        SELECT 
+            COUNT(q.id) as total_questions,
+            SUM(CASE WHEN h.times_correct > 0 THEN 1 ELSE 0 END) as mastered_count
+        FROM questions q
+        LEFT JOIN history h ON q.id = h.question_id
+    """).fetchone()
+    return dict(row)
 
 def get_due_question():
-    conn = get_db_connection()
+    conn = get_conn()
     query = """
         SELECT q.*, h.ease_factor, h.streak, h.interval_days
         FROM questions q 
@@ -98,68 +183,49 @@ def get_due_question():
         ORDER BY h.next_review_due ASC LIMIT 1
     """
     row = conn.execute(query, (datetime.now(),)).fetchone()
-    conn.close()
     return dict(row) if row else None
 
 # --- FIXED: Logic moved inside function ---
 def update_history(q_id, is_correct, sm2_data):
-    conn = get_db_connection()
     now = datetime.now()
+    tc = 1 if is_correct else 0
+    tw = 0 if is_correct else 1
     
-    # Check if exists
-    exists = conn.execute("SELECT 1 FROM history WHERE question_id = ?", (q_id,)).fetchone()
-    
-    if exists:
-        if is_correct:
-            sql = '''UPDATE history SET times_correct = times_correct + 1, last_seen = ?, 
-                     next_review_due = ?, streak = ?, ease_factor = ?, interval_days = ? 
-                     WHERE question_id = ?'''
-        else:
-            sql = '''UPDATE history SET times_wrong = times_wrong + 1, last_seen = ?, 
-                     next_review_due = ?, streak = ?, ease_factor = ?, interval_days = ? 
-                     WHERE question_id = ?'''
-        
-        params = (now, sm2_data['next_due'], sm2_data['repetitions'], 
-                  sm2_data['ease_factor'], sm2_data['interval'], q_id)
-        conn.execute(sql, params)
-    else:
-        # First time seeing it
-        sql = '''INSERT INTO history (question_id, times_correct, times_wrong, last_seen, 
-                 next_review_due, streak, ease_factor, interval_days)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
-        tc = 1 if is_correct else 0
-        tw = 0 if is_correct else 1
+    # Insert on first sight, otherwise bump the counters and reschedule
+    sql = '''INSERT INTO history (question_id, times_correct, times_wrong, last_seen, 
+             next_review_due, streak, ease_factor, interval_days)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+             ON CONFLICT(question_id) DO UPDATE SET
+                 times_correct = times_correct + excluded.times_correct,
+                 times_wrong = times_wrong + excluded.times_wrong,
+                 last_seen = excluded.last_seen,
+                 next_review_due = excluded.next_review_due,
+                 streak = excluded.streak,
+                 ease_factor = excluded.ease_factor,
+                 interval_days = excluded.interval_days'''
+    with transaction() as conn:
         conn.execute(sql, (q_id, tc, tw, now, sm2_data['next_due'], 
                            sm2_data['repetitions'], sm2_data['ease_factor'], sm2_data['interval']))
-    
-    conn.commit()
-    conn.close()
 
 def get_all_topics():
-    conn = get_db_connection()
+    conn = get_conn()
     try:
         rows = conn.execute("SELECT DISTINCT topic FROM questions ORDER BY topic").fetchall()
         return [r['topic'] for r in rows]
     except:
         return []
-    finally:
-        conn.close()
 
 def get_study_questions(topic="All"):
-    conn = get_db_connection()
-    try:
-        if topic and topic != "All":
-            rows = conn.execute("SELECT * FROM questions WHERE topic = ? ORDER BY id", (topic,)).fetchall()
-        else:
-            rows = conn.execute("SELECT * FROM questions ORDER BY id").fetchall()
-        return [dict(r) for r in rows]
-    finally:
-        conn.close()
+    conn = get_conn()
+    if topic and topic != "All":
+        rows = conn.execute("SELECT * FROM questions WHERE topic = ? ORDER BY id", (topic,)).fetchall()
+    else:
+        rows = conn.execute("SELECT * FROM questions ORDER BY id").fetchall()
+    return [question_from_row(r) for r in rows]
 
 # --- NEW: Pagination for Bulk Editor ---
-def get_questions_paginated(limit=50, offset=0, topic=None, show_unknown=False):
-    conn = get_db_connection()
-    query = "SELECT id, question_number, topic, question_text, correct_answer, explanation FROM questions"
+def editor_filters(topic=None, show_unknown=False):
+    """Build the shared WHERE clause for the editor page and count queries"""
     params = []
     conditions = []
     
@@ -169,64 +235,102 @@ def get_questions_paginated(limit=50, offset=0, topic=None, show_unknown=False):
     
     if show_unknown:
         conditions.append("correct_answer LIKE '%Unknown%'")
-        
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
-        
-    query += " ORDER BY id LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
-    
-    df = pd.read_sql(query, conn, params=params)
-    
-    # Get total count for pagination UI
-    count_query = "SELECT COUNT(*) FROM questions"
-    if conditions:
-        count_query += " WHERE " + " AND ".join(conditions)
-    
-    total = conn.execute(count_query, params[:-2]).fetchone()[0]
     
-    conn.close()
-    return df, total
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    return where, params
+
+def get_questions_page(limit=50, offset=0, topic=None, show_unknown=False):
+    where, params = editor_filters(topic, show_unknown)
+    query = "SELECT id, question_number, topic, question_text, correct_answer, explanation FROM questions"
+    query += where + " ORDER BY id LIMIT ? OFFSET ?"
+    return pd.read_sql(query, get_conn(), params=params + [limit, offset])
+
+def count_questions(topic=None, show_unknown=False):
+    # Total count for pagination UI
+    where, params = editor_filters(topic, show_unknown)
+    return get_conn().execute("SELECT COUNT(*) FROM questions" + where, params).fetchone()[0]
+
+# Columns that feed the AI explanation prompt; changing one makes saved explanations stale
+PROMPT_COLUMNS = ("question_text", "options", "correct_answer")
 
 def update_bulk_questions(updates):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
+        # Group rows that touch the same columns so each group is one executemany
+        groups = {}
         for u in updates:
-            q_id = u.pop("id")
-            if not u: continue
-            
-            set_clause = ", ".join([f"{k} = ?" for k in u.keys()])
-            values = list(u.values()) + [q_id]
-            cursor.execute(f"UPDATE questions SET {set_clause} WHERE id = ?", values)
-        conn.commit()
+            cols = tuple(sorted(k for k in u.keys() if k != "id"))
+            if not cols: continue
+            groups.setdefault(cols, []).append(tuple(u[k] for k in cols) + (u["id"],))
+        
+        with transaction() as conn:
+            for cols, rows in groups.items():
+                # The editor resubmits every row on the page, so only drop explanations
+                # for questions whose prompt fields actually change
+                stale = [i for i, k in enumerate(cols) if k in PROMPT_COLUMNS]
+                if stale:
+                    changed = " OR ".join(f"{cols[i]} IS NOT ?" for i in stale)
+                    conn.executemany(f"""
+                        DELETE FROM ai_explanations WHERE question_id = ?
+                        AND EXISTS (SELECT 1 FROM questions WHERE id = ? AND ({changed}))
+                    """, [(r[-1], r[-1]) + tuple(r[i] for i in stale) for r in rows])
+                
+                set_clause = ", ".join([f"{k} = ?" for k in cols])
+                conn.executemany(f"UPDATE questions SET {set_clause} WHERE id = ?", rows)
         return True
     except Exception as e:
         print(f"Bulk Update Error: {e}")
         return False
-    finally:
-        conn.close()
 
 # --- NEW: Exam Mode Support ---
 def get_exam_questions(limit=100):
     """Get random selection of questions for mock exam"""
-    conn = get_db_connection()
-    rows = conn.execute("SELECT * FROM questions ORDER BY RANDOM() LIMIT ?", (limit,)).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    conn = get_conn()
+    max_id = conn.execute("SELECT MAX(id) FROM questions").fetchone()[0]
+    if not max_id:
+        return []
+    total = conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+    target = min(limit, total)
+
+    # Sample random ids instead of sorting the whole table; re-draw to fill gaps
+    rows = {}
+    for _ in range(5):
+        if len(rows) >= target: break
+        ids = random.sample(range(1, max_id + 1), min((target - len(rows)) * 2, max_id))
+        placeholders = ','.join('?' for _ in ids)
+        fetched = [r for r in conn.execute(f"SELECT * FROM questions WHERE id IN ({placeholders})", ids)
+                   if r['id'] not in rows]
+        # IN (...) returns rows in id order, so pick among them at random rather than truncating
+        for r in random.sample(fetched, min(len(fetched), target - len(rows))):
+            rows[r['id']] = question_from_row(r)
+
+    # Sparse id range: top up the remainder the old way
+    if len(rows) < target:
+        placeholders = ','.join('?' for _ in rows)
+        sql = f"SELECT * FROM questions WHERE id NOT IN ({placeholders}) ORDER BY RANDOM() LIMIT ?"
+        for r in conn.execute(sql, list(rows) + [target - len(rows)]):
+            rows[r['id']] = question_from_row(r)
+
+    result = list(rows.values())
+    random.shuffle(result)
+    return result
 
 # --- NEW: Flagging Support ---
 def toggle_flag(q_id, current_status):
-    conn = get_db_connection()
     new_status = not current_status
-    conn.execute("UPDATE questions SET flagged = ? WHERE id = ?", (new_status, q_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("UPDATE questions SET flagged = ? WHERE id = ?", (new_status, q_id))
     return new_status
 
 # --- NEW: Quarantine Access ---
 def get_parsing_errors():
-    conn = get_db_connection()
-    df = pd.read_sql("SELECT * FROM parsing_errors", conn)
-    conn.close()
-    return df
\ No newline at end of file
+    return pd.read_sql("SELECT * FROM parsing_errors", get_conn())
+
+# --- NEW: AI Explanation Cache ---
+def get_saved_explanation(q_id, model):
+    row = get_conn().execute("SELECT text FROM ai_explanations WHERE question_id = ? AND model = ?", (q_id, model)).fetchone()
+    return row['text'] if row else None
+
+def save_explanation(q_id, model, text):
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO ai_explanations (question_id, model, text, created_at) VALUES (?, ?, ?, ?)",
+                     (q_id, model, text, datetime.now()))
\ No newline at end of file